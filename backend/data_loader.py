@@ -1,63 +1,290 @@
 import pandas as pd
+import numpy as np
 import os
+import json
+import threading
 
-# Global variables to hold our DataFrames
-grn_df = None
-sob_df = None
+# Everything built from one load of the Excel file, published together as a single dict:
+#   grn, sob          - the parsed DataFrames
+#   supplier_rows     - row positions of each supplier's GRN lines, keyed by column then supplier value
+#   date_order        - GRN row positions ordered by GRN DATE
+#   sorted_dates      - the GRN dates in that order, for date lookups
+#   totals            - dataset-wide RECEIVED/ACCEPTED/REJECTED QTY sums
+#   mtime             - modification time of the Excel file the frames were parsed from
+# A reload builds a fresh dict and swaps it in under the lock, so a reader never pairs
+# one load's frame with another load's indexes.
+data_snapshot = None
+data_lock = threading.Lock()
 
-def load_data():
-    global grn_df, sob_df
-    
+# Serializes reloads, so when the workbook changes only one thread parses it and
+# rewrites the Parquet cache while the others wait for its snapshot
+load_lock = threading.RLock()
+
+# Bump whenever read_excel_sheets() changes how sheets are parsed, so Parquet copies
+# written by an older version are re-parsed instead of reused
+PARQUET_CACHE_VERSION = 1
+
+def get_excel_path():
     # Path to the data file. The file was moved inside the backend/data directory.
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    excel_path = os.path.join(base_dir, "data", "sob_deviation.xlsx")
-    
-    if not os.path.exists(excel_path):
-        print(f"Warning: Excel file not found at {excel_path}. Creating empty DataFrames.")
-        grn_df = pd.DataFrame()
-        sob_df = pd.DataFrame()
-        return
+    return os.path.join(base_dir, "data", "sob_deviation.xlsx")
 
+def is_data_stale(snapshot):
+    """
+    True when the Excel file on disk has changed since `snapshot` was loaded.
+    """
     try:
-        # Load GRN Data
-        grn_df = pd.read_excel(excel_path, sheet_name="GRN ")
+        return os.path.getmtime(get_excel_path()) != snapshot["mtime"]
+    except OSError:
+        return False
+
+def get_parquet_path(sheet):
+    """
+    Path of the Parquet copy of a parsed sheet ("grn" or "sob"), kept next to the Excel file.
+    """
+    base, _ = os.path.splitext(get_excel_path())
+    return f"{base}.{sheet}.parquet"
+
+def read_excel_sheets(excel_path):
+    """
+    Parses the GRN and SOB sheets from the Excel file. A sheet that fails to load comes back empty.
+    """
+    try:
+        # Open the workbook once; both sheets are parsed from the same handle
+        excel_file = pd.ExcelFile(excel_path)
+    except Exception as e:
+        print(f"Error opening Excel file: {e}")
+        return pd.DataFrame(), pd.DataFrame()
+
+    with excel_file:
+        try:
+            # Load GRN Data
+            grn = pd.read_excel(excel_file, sheet_name="GRN ")
         
-        # Strip whitespace from column names for easier access
-        grn_df.columns = grn_df.columns.str.strip()
+            # Strip whitespace from column names for easier access
+            grn.columns = grn.columns.str.strip()
         
-        # Ensure date columns are datetime
-        grn_df["GRN DATE"] = pd.to_datetime(grn_df["GRN DATE"], errors='coerce')
-        grn_df["SUPPLIER INVOICE DATE"] = pd.to_datetime(grn_df["SUPPLIER INVOICE DATE"], errors='coerce')
+            # Ensure date columns are datetime
+            grn["GRN DATE"] = pd.to_datetime(grn["GRN DATE"], errors='coerce')
+            grn["SUPPLIER INVOICE DATE"] = pd.to_datetime(grn["SUPPLIER INVOICE DATE"], errors='coerce')
+
+            # Supplier names repeat on every GRN line; as a category, equality filters and
+            # .str.lower() work on the handful of distinct names instead of every row
+            grn["SUPPLIER NAME"] = grn["SUPPLIER NAME"].astype("category")
+
+            # Quantities are small whole numbers; keep them in the narrowest integer type.
+            # Series.sum() returns an int64 scalar, but groupby sums, transform('sum') and
+            # column arithmetic keep the narrow dtype, so cast to int64 before subtracting or
+            # multiplying these columns. Columns that aren't purely integer (blanks, stray
+            # text) are left exactly as read.
+            for col in ("QUANTITY", "RECEIVED QTY", "ACCEPTED QTY", "REJECTED QTY"):
+                if col in grn.columns and pd.api.types.is_integer_dtype(grn[col]):
+                    grn[col] = pd.to_numeric(grn[col], downcast="integer")
         
-    except Exception as e:
-        print(f"Error loading GRN sheet: {e}")
-        grn_df = pd.DataFrame()
+        except Exception as e:
+            print(f"Error loading GRN sheet: {e}")
+            grn = pd.DataFrame()
 
-    try:
-        # Load SOB (Schedule of Business / Allocations) Data
-        sob_df = pd.read_excel(excel_path, sheet_name="SOB ")
+        try:
+            # Load SOB (Schedule of Business / Allocations) Data
+            sob = pd.read_excel(excel_file, sheet_name="SOB ")
         
-        # Strip whitespace from column names
-        sob_df.columns = sob_df.columns.str.strip()
+            # Strip whitespace from column names
+            sob.columns = sob.columns.str.strip()
         
-        # Ensure date columns are datetime
-        sob_df["Valid from"] = pd.to_datetime(sob_df["Valid from"], errors='coerce')
-        sob_df["Valid to"] = pd.to_datetime(sob_df["Valid to"], errors='coerce')
+            # Ensure date columns are datetime
+            sob["Valid from"] = pd.to_datetime(sob["Valid from"], errors='coerce')
+            sob["Valid to"] = pd.to_datetime(sob["Valid to"], errors='coerce')
         
+        except Exception as e:
+            print(f"Error loading SOB sheet: {e}")
+            sob = pd.DataFrame()
+
+    return grn, sob
+
+def get_parquet_info_path():
+    """
+    Path of the JSON file recording which Excel file (and cache version) the Parquet copies came from.
+    """
+    base, _ = os.path.splitext(get_excel_path())
+    return f"{base}.parquet.json"
+
+def get_source_info(excel_path):
+    """
+    Identifies the Excel file as parsed by this version: cache version, exact mtime and size.
+    """
+    stat = os.stat(excel_path)
+    return {
+        "version": PARQUET_CACHE_VERSION,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_size": stat.st_size,
+    }
+
+def read_parquet_sheets(source_info):
+    """
+    Returns the GRN and SOB frames from their Parquet copies, or None if either copy is
+    missing or unreadable, or was not written from exactly `source_info`.
+    """
+    paths = [get_parquet_path("grn"), get_parquet_path("sob")]
+    try:
+        with open(get_parquet_info_path()) as f:
+            if json.load(f) != source_info:
+                return None
+        return tuple(pd.read_parquet(path) for path in paths)
+    except OSError:
+        return None
     except Exception as e:
-        print(f"Error loading SOB sheet: {e}")
-        sob_df = pd.DataFrame()
+        print(f"Could not read cached Parquet data, re-reading Excel: {e}")
+        return None
+
+def write_parquet_sheets(grn, sob, source_info):
+    """
+    Saves the parsed sheets as Parquet (needs pyarrow) so the next load can skip Excel parsing.
+    The info file is written last, so a partly written cache is never picked up.
+    """
+    info_path = get_parquet_info_path()
+    try:
+        if os.path.exists(info_path):
+            os.remove(info_path)
+        grn.to_parquet(get_parquet_path("grn"), index=False)
+        sob.to_parquet(get_parquet_path("sob"), index=False)
+        with open(info_path, "w") as f:
+            json.dump(source_info, f)
+    except Exception as e:
+        print(f"Warning: could not cache data as Parquet: {e}")
+
+def empty_snapshot(mtime=None):
+    """
+    A snapshot with no data, used when the Excel file is missing and as the base for a new load.
+    """
+    return {
+        "grn": pd.DataFrame(),
+        "sob": pd.DataFrame(),
+        "supplier_rows": {},
+        "date_order": None,
+        "sorted_dates": None,
+        "totals": {},
+        "mtime": mtime,
+    }
+
+def publish_snapshot(snapshot):
+    """
+    Makes a fully built snapshot the one every getter reads from.
+    """
+    global data_snapshot
+    with data_lock:
+        data_snapshot = snapshot
+
+def build_snapshot():
+    """
+    Loads the workbook (or its Parquet copies) and builds a snapshot with its indexes and totals.
+    """
+    excel_path = get_excel_path()
+    
+    if not os.path.exists(excel_path):
+        print(f"Warning: Excel file not found at {excel_path}. Creating empty DataFrames.")
+        return empty_snapshot()
+
+    # Record the mtime before parsing so a write that lands mid-load still triggers a reload
+    data_mtime = os.path.getmtime(excel_path)
+    source_info = get_source_info(excel_path)
+
+    # Prefer the Parquet copies (typed, no date parsing) when they were written from this exact file
+    cached = read_parquet_sheets(source_info)
+    if cached is not None:
+        grn_df, sob_df = cached
+    else:
+        grn_df, sob_df = read_excel_sheets(excel_path)
+        if not grn_df.empty and not sob_df.empty:
+            write_parquet_sheets(grn_df, sob_df, source_info)
+
+    snapshot = empty_snapshot(data_mtime)
+    snapshot["grn"] = grn_df
+    snapshot["sob"] = sob_df
+
+    # Group row positions by supplier once so per-supplier filters don't rescan the column
+    snapshot["supplier_rows"] = {
+        col: grn_df.groupby(col).indices
+        for col in ("SUPPLIER CODE", "SUPPLIER NAME")
+        if col in grn_df.columns
+    }
+
+    # Sort row positions by date once so a single-day lookup is a binary search
+    if "GRN DATE" in grn_df.columns:
+        grn_dates = grn_df["GRN DATE"].to_numpy()
+        snapshot["date_order"] = np.argsort(grn_dates, kind="stable")
+        snapshot["sorted_dates"] = grn_dates[snapshot["date_order"]]
+
+    # The overall totals only change when the file does, so sum them once here
+    snapshot["totals"] = {
+        col: grn_df[col].sum()
+        for col in ("RECEIVED QTY", "ACCEPTED QTY", "REJECTED QTY")
+        if col in grn_df.columns
+    }
 
     print(f"Data Loaded Successfully. GRN rows: {len(grn_df)}, SOB rows: {len(sob_df)}")
+    return snapshot
+
+def load_data():
+    with load_lock:
+        publish_snapshot(build_snapshot())
 
+def needs_reload(snapshot, frame):
+    return snapshot is None or snapshot[frame].empty or is_data_stale(snapshot)
+
+def get_snapshot(frame="grn"):
+    """
+    Returns the current data snapshot, reloading first if it is missing, `frame`
+    ("grn" or "sob") is empty, or the Excel file has changed since it was loaded.
+    """
+    with data_lock:
+        snapshot = data_snapshot
+    if needs_reload(snapshot, frame):
+        with load_lock:
+            # Another thread may have reloaded while this one waited for the lock
+            with data_lock:
+                snapshot = data_snapshot
+            if needs_reload(snapshot, frame):
+                load_data()
+                with data_lock:
+                    snapshot = data_snapshot
+    return snapshot
+
+# The getters hand out the shared DataFrames without copying; callers filter
+# into new frames and must not modify the returned frame in place.
 def get_grn_df():
-    global grn_df
-    if grn_df is None or grn_df.empty:
-        load_data()
-    return grn_df.copy() if grn_df is not None else pd.DataFrame()
+    return get_snapshot("grn")["grn"]
 
 def get_sob_df():
-    global sob_df
-    if sob_df is None or sob_df.empty:
-        load_data()
-    return sob_df.copy() if sob_df is not None else pd.DataFrame()
+    return get_snapshot("sob")["sob"]
+
+def get_grn_totals():
+    """
+    Returns the dataset-wide quantity totals precomputed by load_data().
+    """
+    return get_snapshot("grn")["totals"]
+
+def get_supplier_grn_df(column, value):
+    """
+    Returns the GRN rows whose `column` ("SUPPLIER CODE" or "SUPPLIER NAME") equals `value`.
+    """
+    snapshot = get_snapshot("grn")
+    grn = snapshot["grn"]
+    positions = snapshot["supplier_rows"].get(column, {}).get(value)
+    if positions is None:
+        return grn.iloc[0:0]
+    return grn.iloc[positions]
+
+def get_grn_df_on_date(date):
+    """
+    Returns the GRN rows whose GRN DATE falls on the same day as `date`, in their original order.
+    """
+    snapshot = get_snapshot("grn")
+    grn = snapshot["grn"]
+    sorted_dates = snapshot["sorted_dates"]
+    if sorted_dates is None:
+        return grn.iloc[0:0]
+    day = pd.Timestamp(date).normalize()
+    bounds = np.array([day, day + pd.Timedelta(days=1)], dtype=sorted_dates.dtype)
+    lo, hi = sorted_dates.searchsorted(bounds, side="left")
+    return grn.iloc[np.sort(snapshot["date_order"][lo:hi])]
@@ -2,7 +2,7 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 import re, os
 import pandas as pd
-from data_loader import get_grn_df, get_sob_df
+from data_loader import get_grn_df, get_sob_df, get_supplier_grn_df, get_grn_totals
 from utils.email_utils import create_supplier_report_pdf
 router = APIRouter()
 class ChatRequest(BaseModel):
@@ -66,32 +66,44 @@ FILTER_ALIASES = {
     "date": "GRN DATE",
 }
 
+# Aliases sorted by length descending so more specific phrases match first.
+# Sorted once at import time rather than on every request.
+SORTED_COLUMN_ALIASES = sorted(COLUMN_ALIASES.keys(), key=len, reverse=True)
+SORTED_FILTER_ALIASES = sorted(FILTER_ALIASES.keys(), key=len, reverse=True)
+
+def find_target_column(query):
+    """
+    Returns the GRN column the query refers to, or None if no alias matches.
+    """
+    q = query.lower()
+    for alias in SORTED_COLUMN_ALIASES:
+        if alias in q:
+            return COLUMN_ALIASES[alias]
+    return None
+
+# Keyword rules for detect_intent, checked in order: the first intent with a matching
+# keyword (and none of its excluded words) wins
+INTENT_RULES = [
+    ("compare", ("compare",), ()),
+    ("excel", ("excel", "spreadsheet", "download", "export"), ()),
+    ("table", ("table", "grid"), ()),
+    ("trend", ("trend", "over time", "moving average", "rolling average"), ()),
+    ("top_n", ("top", "most", "highest", "lowest"), ()),
+    ("mom", ("mom", "month over month", "month-over-month", "vs last month", "change this month"), ()),
+    ("summary", ("summary", "summarize"), ("report", "pdf")),
+    ("report", ("report", "pdf"), ()),
+    ("quota", ("quota", "allocate", "percentage"), ()),
+    ("allocation", ("allocation", "breach"), ()),
+]
+
 def detect_intent(query):
     q = query.lower()
-    if "compare" in q:
-        return "compare"
-    if "excel" in q or "spreadsheet" in q or "download" in q or "export" in q:
-        return "excel"
-    if "table" in q or "grid" in q:
-        return "table"
-    if "trend" in q or "over time" in q or "moving average" in q or "rolling average" in q:
-        return "trend"
-    if "top" in q or "most" in q or "highest" in q or "lowest" in q:
-        return "top_n"
-    if "mom" in q or "month over month" in q or "month-over-month" in q or "vs last month" in q or "change this month" in q:
-        return "mom"
-    if ("summary" in q or "summarize" in q) and "report" not in q and "pdf" not in q:
-        return "summary"
-    if "report" in q or "pdf" in q:
-        return "report"
-    if "quota" in q or "allocate" in q or "percentage" in q:
-        return "quota"
-    if "allocation" in q or "breach" in q:
-        return "allocation"
+    for intent, keywords, excluded in INTENT_RULES:
+        if any(k in q for k in keywords) and not any(k in q for k in excluded):
+            return intent
     # Lookup should be checked before 'reject' so that 'reason for rejection' is correctly handled
-    for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-        if alias in q:
-            return "lookup"
+    if find_target_column(q):
+        return "lookup"
     if "reject" in q or "rejection" in q:
         return "reject"
     return "general"
@@ -133,23 +145,18 @@ def handle_lookup(df, query):
     q = query.lower()
     
     # ── Step 1: Find which column the user is asking about ─────────────
-    target_col = None
-    # Sort aliases by length descending so more specific phrases match first
-    for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-        if alias in q:
-            target_col = COLUMN_ALIASES[alias]
-            break
+    target_col = find_target_column(query)
     
     if not target_col:
         return {"response": "I couldn't identify which column you're asking about. Try mentioning the column name like 'total invoice amount', 'received qty', 'rejection reason', etc."}
     
     # ── Step 2: Find filters (what rows to look at) ────────────────────
-    filtered_df = df.copy()
+    filtered_df = df
     filters_applied = []
     matched_spans = [] # Keep track of chars already used for a filter
     
     # Extract all filters present in the query
-    for alias in sorted(FILTER_ALIASES.keys(), key=len, reverse=True):
+    for alias in SORTED_FILTER_ALIASES:
         if alias in q:
             filter_col = FILTER_ALIASES[alias]
             # Pattern to extract value after alias (e.g., "po-123", "date 10/1/2026")
@@ -169,8 +176,8 @@ def handle_lookup(df, query):
                 # Special handling for dates
                 if filter_col == "GRN DATE":
                     try:
-                        search_date = pd.to_datetime(match_val, dayfirst=True)
-                        temp_df = filtered_df[filtered_df[filter_col].dt.date == search_date.date()]
+                        search_date = pd.to_datetime(match_val, dayfirst=True).normalize()
+                        temp_df = filtered_df[filtered_df[filter_col].dt.normalize() == search_date]
                     except:
                         continue
                 else:
@@ -238,10 +245,13 @@ def handle_lookup(df, query):
         }
 
 
-def handle_summary(df):
-    total_received = df['RECEIVED QTY'].sum()
-    total_accepted = df['ACCEPTED QTY'].sum()
-    total_rejected = df['REJECTED QTY'].sum()
+def handle_summary(df, totals=None):
+    # totals: precomputed dataset-wide sums, passed when df is the unfiltered dataset
+    if totals is None:
+        totals = df[['RECEIVED QTY', 'ACCEPTED QTY', 'REJECTED QTY']].sum()
+    total_received = totals['RECEIVED QTY']
+    total_accepted = totals['ACCEPTED QTY']
+    total_rejected = totals['REJECTED QTY']
     
     rejection_rate = round((total_rejected / total_received) * 100, 2) if total_received > 0 else 0
     
@@ -322,25 +332,23 @@ def handle_trend(df, target_col=None, supplier_wise=False, rolling_window=None):
         
     if supplier_wise:
         target_col = target_col or 'ACCEPTED QTY'
+        if not pd.api.types.is_numeric_dtype(df[target_col]):
+            return {"response": f"⚠️ Column '{target_col}' is not numeric, so I can't chart a trend for it."}
         agg_func = 'mean' if "PRICE" in target_col.upper() else 'sum'
         
-        trend_df = df.groupby([df['GRN DATE'].dt.date, 'SUPPLIER NAME']).agg({
-            target_col: agg_func
-        }).reset_index()
-        
-        all_dates = sorted(trend_df['GRN DATE'].unique())
-        labels = [str(d) for d in all_dates]
-        
+        trend_series = df.groupby([df['GRN DATE'].dt.date, 'SUPPLIER NAME'])[target_col].agg(agg_func)
+
+        # Pivot into a (date x supplier) grid in one pass; dates a supplier did not deliver on become 0
+        trend_grid = trend_series.unstack('SUPPLIER NAME', fill_value=0)
+        labels = [str(d) for d in trend_grid.index]
+
+        # Moving average over every supplier column in a single rolling pass
+        if rolling_window:
+            trend_grid = trend_grid.rolling(window=rolling_window, min_periods=1).mean()
+
         datasets = []
-        for supplier in trend_df['SUPPLIER NAME'].unique():
-            # Get only the target column series for this supplier and reindex to explicitly zero missing dates
-            sup_series = trend_df[trend_df['SUPPLIER NAME'] == supplier].set_index('GRN DATE')[target_col].reindex(all_dates, fill_value=0)
-            sup_df = sup_series.to_frame()
-            
-            if rolling_window:
-                sup_df[target_col] = sup_df[target_col].rolling(window=rolling_window, min_periods=1).mean()
-                
-            data = sup_df[target_col].tolist()
+        for supplier in trend_series.index.get_level_values('SUPPLIER NAME').unique():
+            data = trend_grid[supplier].tolist()
             label_suffix = f"({rolling_window}-Day Avg {target_col})" if rolling_window else f"({target_col})"
             datasets.append({"label": f"{supplier} {label_suffix}", "data": data})
             
@@ -354,6 +362,9 @@ def handle_trend(df, target_col=None, supplier_wise=False, rolling_window=None):
     else:
         # Group by GRN DATE
         if target_col and target_col in df.columns:
+            if not pd.api.types.is_numeric_dtype(df[target_col]):
+                return {"response": f"⚠️ Column '{target_col}' is not numeric, so I can't chart a trend for it."}
+
             # For prices, we usually want the average per day if multiple records exist,
             # but for quantities we want the sum.
             agg_func = 'mean' if "PRICE" in target_col.upper() else 'sum'
@@ -447,7 +458,8 @@ def handle_allocation(df):
     total_breaches = len(breaches)
     
     # Calculate the differences to find the worst offender
-    worst_offender_idx = (breaches['ACCEPTED QTY'] - breaches['RECEIVED QTY']).idxmax()
+    # Widen first: the quantity columns are narrow ints and the difference could wrap
+    worst_offender_idx = (breaches['ACCEPTED QTY'].astype('int64') - breaches['RECEIVED QTY'].astype('int64')).idxmax()
     worst_name = breaches.loc[worst_offender_idx, 'SUPPLIER NAME']
     
     response = (
@@ -512,6 +524,9 @@ def handle_top_n(df, query, target_col=None):
         
     if target_col not in df.columns:
         return {"response": f"⚠️ Column '{target_col}' not found for analysis."}
+
+    if not pd.api.types.is_numeric_dtype(df[target_col]):
+        return {"response": f"⚠️ Column '{target_col}' is not numeric, so it can't be used to rank {entity_name.lower()}."}
         
     # 5. Aggregate and Sort
     agg_func = 'mean' if "PRICE" in target_col.upper() else 'sum'
@@ -547,6 +562,9 @@ def handle_mom(df, query, target_col=None):
         
     if target_col not in df.columns:
         return {"response": f"⚠️ Column '{target_col}' not found for analysis."}
+
+    if not pd.api.types.is_numeric_dtype(df[target_col]):
+        return {"response": f"⚠️ Column '{target_col}' is not numeric, so it can't be compared month over month."}
         
     # Find the latest month and the month before it
     # We do this dynamically based on the dataset's dates
@@ -566,9 +584,10 @@ def handle_mom(df, query, target_col=None):
         prev_month = current_month - 1
         prev_year = current_year
         
-    # Filter dataframes
-    curr_df = df[(df['GRN DATE'].dt.month == current_month) & (df['GRN DATE'].dt.year == current_year)]
-    prev_df = df[(df['GRN DATE'].dt.month == prev_month) & (df['GRN DATE'].dt.year == prev_year)]
+    # Filter dataframes on a single year*12+month key, extracted once for both months
+    month_key = df['GRN DATE'].dt.year * 12 + df['GRN DATE'].dt.month
+    curr_df = df[month_key == current_year * 12 + current_month]
+    prev_df = df[month_key == prev_year * 12 + prev_month]
     
     agg_func = 'mean' if "PRICE" in target_col.upper() else 'sum'
     
@@ -718,7 +737,7 @@ def chat(request: ChatRequest):
     
     # Don't filter df for lookup — lookup does its own filtering
     if suppliers and intent not in ("compare", "report", "quota", "excel", "lookup", "trend"):
-        df = df[df['SUPPLIER NAME'] == suppliers[0]]
+        df = get_supplier_grn_df('SUPPLIER NAME', suppliers[0])
         
     # Also filter by material for trends if specified
     if materials and intent in ("trend", "table"):
@@ -728,24 +747,16 @@ def chat(request: ChatRequest):
                 df['MATERIAL NO'].str.lower().isin(m_list)]
         
     if intent == "summary":
-        return handle_summary(df)
+        return handle_summary(df, None if suppliers else get_grn_totals())
         
     elif intent == "compare":
         # Identify if they are asking for a specific column compare
-        target_col = None
-        for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-            if alias in query.lower():
-                target_col = COLUMN_ALIASES[alias]
-                break
+        target_col = find_target_column(query)
         return handle_compare(get_grn_df(), suppliers, materials, target_col)
         
     elif intent == "trend":
         # Identify if they are asking for a specific column trend
-        target_col = None
-        for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-            if alias in query.lower():
-                target_col = COLUMN_ALIASES[alias]
-                break
+        target_col = find_target_column(query)
                 
         q_lower = query.lower()
         supplier_wise = "supplier wise" in q_lower or "by supplier" in q_lower or "each supplier" in q_lower or len(suppliers) > 1
@@ -777,19 +788,11 @@ def chat(request: ChatRequest):
         return handle_excel(get_grn_df(), suppliers, materials)
         
     elif intent == "top_n":
-        target_col = None
-        for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-            if alias in query.lower():
-                target_col = COLUMN_ALIASES[alias]
-                break
+        target_col = find_target_column(query)
         return handle_top_n(df, query, target_col)
         
     elif intent == "mom":
-        target_col = None
-        for alias in sorted(COLUMN_ALIASES.keys(), key=len, reverse=True):
-            if alias in query.lower():
-                target_col = COLUMN_ALIASES[alias]
-                break
+        target_col = find_target_column(query)
         return handle_mom(df, query, target_col)
     
     elif intent == "lookup":
@@ -802,7 +805,7 @@ def chat(request: ChatRequest):
         return handle_allocation(df)
         
     elif intent == "reject":
-        total_rej = df['REJECTED QTY'].sum()
+        total_rej = df['REJECTED QTY'].sum() if suppliers else get_grn_totals()['REJECTED QTY']
         if suppliers:
             return {"response": f"The total rejected quantity for {suppliers[0]} is {int(total_rej):,}."}
         return {"response": f"The total rejected quantity across all suppliers is {int(total_rej):,}."}
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Query, HTTPException, BackgroundTasks
 import pandas as pd
 from typing import Optional, List, Dict, Any
-from data_loader import get_grn_df, get_sob_df
-from utils.email_utils import send_breach_email, create_allocation_breach_pdf
+from data_loader import get_grn_df, get_sob_df, get_supplier_grn_df, get_grn_df_on_date, get_grn_totals
+from utils.email_utils import build_breach_email, send_breach_emails, create_allocation_breach_pdf
 import os
 from datetime import datetime
 
@@ -27,13 +27,10 @@ def get_merged_allocation_data():
         'REJECTED QTY': 'sum'
     })
 
-    # Calculate Total Received Qty for each Material across all suppliers
-    material_totals = grn_agg.groupby('MATERIAL NO')['RECEIVED QTY'].sum().reset_index()
-    material_totals.rename(columns={'RECEIVED QTY': 'TOTAL_MATERIAL_RECEIVED'}, inplace=True)
-    
-    # Merge to get the total back into the grn_agg
-    grn_agg = pd.merge(grn_agg, material_totals, on='MATERIAL NO', how='left')
-    
+    # Calculate Total Received Qty for each Material across all suppliers,
+    # broadcast straight back onto each row (no separate merge needed)
+    grn_agg['TOTAL_MATERIAL_RECEIVED'] = grn_agg.groupby('MATERIAL NO')['RECEIVED QTY'].transform('sum')
+
     # Calculate the Actual Percentage supplied
     grn_agg['ACTUAL_PERCENTAGE'] = (grn_agg['RECEIVED QTY'] / grn_agg['TOTAL_MATERIAL_RECEIVED']) * 100
     grn_agg['ACTUAL_PERCENTAGE'] = grn_agg['ACTUAL_PERCENTAGE'].fillna(0).round(2)
@@ -67,11 +64,15 @@ def get_overall_receipts():
     if df.empty:
         return {"error": "NO_DATA"}
 
+    totals = get_grn_totals()
+    total_received = totals['RECEIVED QTY']
+    total_rejected = totals['REJECTED QTY']
+
     return {
-        "total_received": int(df['RECEIVED QTY'].sum()),
-        "total_accepted": int(df['ACCEPTED QTY'].sum()),
-        "total_rejected": int(df['REJECTED QTY'].sum()),
-        "rejection_rate_percent": round((df['REJECTED QTY'].sum() / df['RECEIVED QTY'].sum()) * 100, 2) if df['RECEIVED QTY'].sum() > 0 else 0
+        "total_received": int(total_received),
+        "total_accepted": int(totals['ACCEPTED QTY']),
+        "total_rejected": int(total_rejected),
+        "rejection_rate_percent": round((total_rejected / total_received) * 100, 2) if total_received > 0 else 0
     }
 
 @router.get("/kpis/supplier-performance")
@@ -84,7 +85,7 @@ def get_supplier_performance(supplier_code: Optional[int] = Query(None, descript
          return {"error": "NO_DATA"}
 
     if supplier_code:
-        df = df[df['SUPPLIER CODE'] == supplier_code]
+        df = get_supplier_grn_df('SUPPLIER CODE', supplier_code)
 
     summary = df.groupby(['SUPPLIER CODE', 'SUPPLIER NAME']).agg({
         'RECEIVED QTY': 'sum',
@@ -139,10 +140,9 @@ def check_allocation_breaches(
     if df.empty:
         raise HTTPException(status_code=500, detail="Data unavailable for check.")
 
-    # Filter by Date
+    # Filter by Date (binary search over the date-sorted GRN rows)
     try:
-        target_date = pd.to_datetime(grn_date).date()
-        df_filtered = df[df['GRN DATE'].dt.date == target_date]
+        df_filtered = get_grn_df_on_date(pd.to_datetime(grn_date))
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
         
@@ -163,18 +163,18 @@ def check_allocation_breaches(
     os.makedirs(alerts_dir, exist_ok=True)
 
     breach_records = []
+
+    # Materialise the rows once as plain dicts; both loops below only read fields by name
+    breach_rows = breaches.to_dict(orient="records")
     
     def process_breach_emails(breach_data, directory):
-        for index, row in breach_data.iterrows():
+        messages = []
+        for row in breach_data:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             safe_supplier = str(row['SUPPLIER NAME']).replace("/", "_").replace(" ", "_")
             pdf_filename = f"Breach_{row['SUPPLIER CODE']}_{safe_supplier}_{timestamp}.pdf"
             pdf_path = os.path.join(directory, pdf_filename)
             
-            # 1. Create PDF
-            create_allocation_breach_pdf(row, pdf_path)
-            
-            # 2. Send Email
             subject = f"ALERT: Allocation Breach Detected for Supplier {row['SUPPLIER NAME']}"
             body = (
                 f"An allocation breach has been detected.\n\n"
@@ -185,19 +185,30 @@ def check_allocation_breaches(
                 f"Please find the detailed PDF report attached."
             )
             
-            send_breach_email(subject, body, pdf_path)
+            # A row whose PDF or email can't be built is skipped; the rest of the batch still goes out
+            try:
+                # 1. Create PDF
+                create_allocation_breach_pdf(row, pdf_path)
+
+                # 2. Build Email (the PDF is read now, before a same-second filename can overwrite it)
+                messages.append(build_breach_email(subject, body, pdf_path))
+            except Exception as e:
+                print(f"Failed to prepare alert {pdf_filename}: {e}")
+
+        # 3. Send all alerts over a single SMTP session
+        send_breach_emails(messages)
 
     # Add email sending to background task so the API responds immediately
-    background_tasks.add_task(process_breach_emails, breaches, alerts_dir)
+    background_tasks.add_task(process_breach_emails, breach_rows, alerts_dir)
 
-    for _, row in breaches.iterrows():
+    for row in breach_rows:
         breach_records.append({
             "supplier_name": str(row['SUPPLIER NAME']),
             "grn_date": grn_date,
             "material_no": str(row['MATERIAL NO']),
             "received_qty": int(row['RECEIVED QTY']),
             "accepted_qty": int(row['ACCEPTED QTY']),
-            "exceeded_qty": int(row['ACCEPTED QTY'] - row['RECEIVED QTY'])
+            "exceeded_qty": int(row['ACCEPTED QTY']) - int(row['RECEIVED QTY'])
         })
 
     return {
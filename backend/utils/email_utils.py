@@ -59,7 +59,7 @@ def create_allocation_breach_pdf(row, pdf_path):
     pdf.cell(0, 8, f"Received Quantity: {row.get('RECEIVED QTY', 0)}", ln=True)
     pdf.cell(0, 8, f"Accepted Quantity: {row.get('ACCEPTED QTY', 0)}", ln=True)
     
-    exceeded = int(row.get('ACCEPTED QTY', 0) - row.get('RECEIVED QTY', 0))
+    exceeded = int(row.get('ACCEPTED QTY', 0)) - int(row.get('RECEIVED QTY', 0))
     pdf.set_font("Arial", 'B', 12)
     pdf.set_text_color(200, 0, 0)
     pdf.cell(0, 8, f"Exceeded Quantity: +{exceeded}", ln=True)
@@ -131,9 +131,11 @@ def create_supplier_report_pdf(supplier_name: str, df, pdf_path: str):
         ACCEPTED_QTY=("ACCEPTED QTY", "sum"),
         REJECTED_QTY=("REJECTED QTY", "sum"),
     )
-    mat_df["ACC_RATE"] = mat_df.apply(
-        lambda r: round(r["ACCEPTED_QTY"] / r["RECEIVED_QTY"] * 100, 1) if r["RECEIVED_QTY"] > 0 else 0,
-        axis=1,
+    # Computed column-wise; materials with nothing received get a 0% rate
+    mat_df["ACC_RATE"] = (
+        (mat_df["ACCEPTED_QTY"] / mat_df["RECEIVED_QTY"] * 100)
+        .where(mat_df["RECEIVED_QTY"] > 0, 0)
+        .round(1)
     )
 
     headers = ["Material No", "Description", "Received", "Accepted", "Rejected", "Acc. Rate"]
@@ -146,10 +148,10 @@ def create_supplier_report_pdf(supplier_name: str, df, pdf_path: str):
         pdf.cell(w, 8, h, border=1, fill=True, align="C")
     pdf.ln()
 
-    # Table data rows
+    # Table data rows (plain dict records avoid building a Series per row)
     pdf.set_font("Arial", "", 10)
     fill = False
-    for _, row in mat_df.iterrows():
+    for row in mat_df.to_dict(orient="records"):
         pdf.set_fill_color(240, 245, 255) if fill else pdf.set_fill_color(255, 255, 255)
         values = [
             str(row["MATERIAL NO"]),
@@ -183,7 +185,7 @@ def create_supplier_report_pdf(supplier_name: str, df, pdf_path: str):
 
     pdf.set_font("Arial", "", 9)
     fill = False
-    for _, row in df.sort_values("GRN DATE").iterrows():
+    for row in df.sort_values("GRN DATE").to_dict(orient="records"):
         pdf.set_fill_color(240, 245, 255) if fill else pdf.set_fill_color(255, 255, 255)
         grn_str = str(row.get("GRN DATE", ""))[:10]
         reason  = str(row.get("REASON FOR REJECTION", ""))[:40] if row.get("REJECTED QTY", 0) > 0 else "-"
@@ -205,32 +207,49 @@ def create_supplier_report_pdf(supplier_name: str, df, pdf_path: str):
     return pdf_path
 
 
-def send_breach_email(subject, body, pdf_path):
+def build_breach_email(subject, body, pdf_path):
     """
-    Sends an email with the attached PDF report.
+    Builds the alert email with the PDF report attached.
     """
-    try:
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = SENDER_EMAIL
-        msg["To"] = RECIPIENT_EMAIL
-        msg.set_content(body)
-
-        with open(pdf_path, "rb") as f:
-            msg.add_attachment(
-                f.read(),
-                maintype="application",
-                subtype="pdf",
-                filename=os.path.basename(pdf_path),
-            )
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = RECIPIENT_EMAIL
+    msg.set_content(body)
+
+    with open(pdf_path, "rb") as f:
+        msg.add_attachment(
+            f.read(),
+            maintype="application",
+            subtype="pdf",
+            filename=os.path.basename(pdf_path),
+        )
+    return msg
+
+
+def send_breach_emails(messages):
+    """
+    Sends a batch of alert emails (from build_breach_email) over one SMTP session,
+    so the TLS handshake and login happen once per batch. Returns how many were sent.
+    """
+    if not messages:
+        return 0
 
+    sent = 0
+    try:
         with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
             server.starttls()
             server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-            
-        print(f"Email successfully sent to {RECIPIENT_EMAIL} for {os.path.basename(pdf_path)}")
-        return True
+
+            for msg in messages:
+                # One rejected message shouldn't stop the rest of the batch
+                try:
+                    server.send_message(msg)
+                    sent += 1
+                    print(f"Email successfully sent to {RECIPIENT_EMAIL}: {msg['Subject']}")
+                except Exception as e:
+                    print(f"Failed to send email '{msg['Subject']}': {e}")
     except Exception as e:
         print(f"Failed to send email: {e}")
-        return False
+    return sent
+